@@ -0,0 +1,373 @@
+"""
+Send requests to API made by `servifier` from other Python code.
+
+Author: Nikolay Lysenko
+"""
+
+
+import asyncio
+import functools
+import http.client
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from servifier import constants
+from servifier.auth import generate_token
+
+
+class ServiceError(Exception):
+    """Error reported by API in response to a request."""
+
+    def __init__(self, msg: str, status: int):
+        """
+        Initialize an instance.
+
+        :param msg:
+            error message from API
+        :param status:
+            HTTP status of response
+        """
+        super().__init__(msg)
+        self.status = status
+
+    def __reduce__(self) -> Tuple[type, Tuple[str, int]]:
+        """Support pickling (e.g., for sending error to another process)."""
+        return type(self), (self.args[0], self.status)
+
+
+class ConnectionPool:
+    """Thread-safe pool of keep-alive HTTP connections to a single host."""
+
+    def __init__(self, url: str, size: int, timeout: float):
+        """
+        Initialize an instance.
+
+        :param url:
+            root URL of API (e.g., 'http://127.0.0.1:5000')
+        :param size:
+            maximum number of simultaneously open connections
+        :param timeout:
+            timeout (in seconds) for blocking operations with sockets
+        """
+        parsed_url = urlsplit(url)
+        if parsed_url.scheme == 'https':
+            self.connection_class = http.client.HTTPSConnection
+        else:
+            self.connection_class = http.client.HTTPConnection
+        self.host = parsed_url.hostname
+        self.port = parsed_url.port
+        self.root_path = parsed_url.path.rstrip('/')
+        self.timeout = timeout
+        self.size = size
+        self.closed = False
+        self.lock = threading.Lock()
+        # Empty slots are represented by `None` and are filled lazily.
+        self.idle_connections = queue.LifoQueue()
+        for _ in range(size):
+            self.idle_connections.put(None)
+
+    def acquire(self) -> http.client.HTTPConnection:
+        """Take a connection from the pool (wait if all of them are busy)."""
+        connection = self.idle_connections.get()
+        if connection is None:
+            connection = self.connection_class(
+                self.host, self.port, timeout=self.timeout
+            )
+        return connection
+
+    def release(
+            self, connection: http.client.HTTPConnection, reusable: bool
+    ) -> None:
+        """Return a connection to the pool."""
+        with self.lock:
+            if not reusable or self.closed:
+                connection.close()
+                connection = None
+            self.idle_connections.put(connection)
+
+    def post(
+            self,
+            path: str,
+            body: bytes,
+            content_type: Optional[str] = 'application/json'
+    ) -> Tuple[int, bytes, Optional[str]]:
+        """Send POST request and return status, payload, and its type."""
+        headers = {}
+        if content_type is not None:
+            headers['Content-Type'] = content_type
+        connection = self.acquire()
+        is_reused = connection.sock is not None
+        try:
+            connection.request('POST', self.root_path + path, body, headers)
+            response = connection.getresponse()
+            payload = response.read()
+        except ConnectionError:
+            self.release(connection, reusable=False)
+            if not is_reused:
+                raise
+            # Server may close idle keep-alive connection at any moment,
+            # so the request is sent once again (usually, via a new one).
+            return self.post(path, body, content_type)
+        except:
+            self.release(connection, reusable=False)
+            raise
+        # If server closes connection, it is re-opened on the next request.
+        self.release(connection, reusable=True)
+        return response.status, payload, response.getheader('Content-Type')
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Close all connections.
+
+        :param wait:
+            if it is `True`, busy connections are waited for and closed
+            here; else, they are closed when they are returned to the pool
+            (it is so for connections taken after this call too)
+        """
+        with self.lock:
+            self.closed = True
+            connections = []
+            if not wait:
+                # Only idle connections are taken, busy ones are not awaited.
+                while True:
+                    try:
+                        connection = self.idle_connections.get_nowait()
+                    except queue.Empty:
+                        break
+                    connections.append(connection)
+        if wait:
+            connections = [
+                self.idle_connections.get() for _ in range(self.size)
+            ]
+        for connection in connections:
+            if connection is not None:
+                connection.close()
+            self.idle_connections.put(None)
+
+
+def make_coalescing_key(path: str, inputs: Dict[str, Any]) -> str:
+    """Make key such that identical calls have identical keys."""
+    return path + ' ' + json.dumps(inputs, sort_keys=True)
+
+
+def coalesce_inputs(
+        path: str, inputs: Iterable[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """
+    Leave only distinct inputs.
+
+    :param path:
+        API path (from root) to a handle
+    :param inputs:
+        arguments for every call
+    :return:
+        distinct arguments and, for every call, index of its arguments
+        within the distinct ones
+    """
+    positions = {}
+    distinct_inputs = []
+    indices = []
+    for call_inputs in inputs:
+        key = make_coalescing_key(path, call_inputs)
+        if key not in positions:
+            positions[key] = len(distinct_inputs)
+            distinct_inputs.append(call_inputs)
+        indices.append(positions[key])
+    return distinct_inputs, indices
+
+
+def parse_response(status: int, payload: bytes) -> Any:
+    """Extract result from API response or raise an error."""
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        data = None
+    if status != constants.OK:
+        if isinstance(data, dict) and 'error' in data:
+            msg = data['error']
+        else:
+            msg = constants.ERRORS.get(status, f'HTTP status {status}')
+        raise ServiceError(msg, status)
+    if not isinstance(data, dict) or 'result' not in data:
+        raise ServiceError('Malformed response: no JSON with result', status)
+    return data['result']
+
+
+class Client:
+    """Synchronous client for API made by `servifier`."""
+
+    def __init__(
+            self,
+            url: str,
+            login: Optional[str] = None,
+            auth_salts: Optional[Dict[str, Optional[str]]] = None,
+            pool_size: int = 10,
+            timeout: float = 60.0,
+            max_retries: int = 2,
+            backoff: float = 0.1,
+            coalesce: bool = False
+    ):
+        """
+        Initialize an instance.
+
+        :param url:
+            root URL of API (e.g., 'http://127.0.0.1:5000')
+        :param login:
+            (optional) login to be sent to handles with authentication
+        :param auth_salts:
+            (optional) mapping from API path to salt from corresponding
+            `HandleSpec`; tokens are generated once here
+        :param pool_size:
+            maximum number of simultaneously open connections and also
+            maximum number of calls sent concurrently by `call_many`
+        :param timeout:
+            timeout (in seconds) for blocking operations with sockets
+        :param max_retries:
+            maximum number of repeated attempts after responses with
+            'Service Unavailable' status or failed connections; note that
+            a request is sent again even if it might have reached API
+            (a request over a stale keep-alive connection is always sent
+            again and it is not counted here)
+        :param backoff:
+            delay (in seconds) before the first repeated attempt;
+            it is doubled for every next attempt
+        :param coalesce:
+            if it is `True`, identical calls that are made concurrently
+            are sent as a single HTTP request
+        """
+        auth_salts = auth_salts or {}
+        if login is None and any(x is not None for x in auth_salts.values()):
+            raise ValueError("Login must be passed if salts are passed.")
+        self.credentials = {
+            path: {'login': login, 'token': generate_token(login, auth_salt)}
+            for path, auth_salt in auth_salts.items()
+            if auth_salt is not None
+        }
+        self.pool = ConnectionPool(url, pool_size, timeout)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.coalesce = coalesce
+        self.pending_calls: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self) -> 'Client':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def send(self, path: str, inputs: Dict[str, Any]) -> Any:
+        """Send a single HTTP request and retry it if it is needed."""
+        data = {**inputs, **self.credentials.get(path, {})}
+        body = json.dumps(data).encode('utf-8')
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                status, payload, _ = self.pool.post(path, body)
+            except ConnectionError:
+                if attempt == self.max_retries:
+                    raise
+                continue
+            if status != constants.SERVICE_UNAVAILABLE:
+                break
+        return parse_response(status, payload)
+
+    def call(self, path: str, **inputs: Any) -> Any:
+        """Call API handle with the given arguments and return its result."""
+        if not self.coalesce:
+            return self.send(path, inputs)
+
+        key = make_coalescing_key(path, inputs)
+        with self.lock:
+            future = self.pending_calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self.pending_calls[key] = future
+        if not is_leader:
+            return future.result()
+        try:
+            result = self.send(path, inputs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.pending_calls.pop(key)
+
+    def call_many(
+            self, path: str, inputs: Iterable[Dict[str, Any]]
+    ) -> List[Any]:
+        """Call API handle concurrently and return results in input order."""
+        if self.coalesce:
+            inputs, indices = coalesce_inputs(path, inputs)
+        else:
+            inputs = list(inputs)
+            indices = list(range(len(inputs)))
+        futures = [
+            self.executor.submit(self.call, path, **call_inputs)
+            for call_inputs in inputs
+        ]
+        results = [future.result() for future in futures]
+        return [results[index] for index in indices]
+
+    def close(self) -> None:
+        """Stop background threads and close connections."""
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+
+
+class AsyncClient:
+    """Asyncio client for API made by `servifier`."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        """
+        Initialize an instance.
+
+        All arguments are passed to `Client` which is used under the hood.
+        """
+        self.client = Client(*args, **kwargs)
+
+    async def __aenter__(self) -> 'AsyncClient':
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def call(self, path: str, **inputs: Any) -> Any:
+        """Call API handle with the given arguments and return its result."""
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self.client.executor,
+            functools.partial(self.client.call, path, **inputs)
+        )
+        return result
+
+    async def call_many(
+            self, path: str, inputs: Iterable[Dict[str, Any]]
+    ) -> List[Any]:
+        """Call API handle concurrently and return results in input order."""
+        if self.client.coalesce:
+            inputs, indices = coalesce_inputs(path, inputs)
+        else:
+            inputs = list(inputs)
+            indices = list(range(len(inputs)))
+        results = await asyncio.gather(
+            *(self.call(path, **call_inputs) for call_inputs in inputs)
+        )
+        return [results[index] for index in indices]
+
+    async def aclose(self) -> None:
+        """Stop background threads and close connections."""
+        loop = asyncio.get_running_loop()
+        # Waiting for calls in progress must not block the event loop.
+        await loop.run_in_executor(None, self.client.close)
@@ -0,0 +1,278 @@
+"""
+Route requests to workers consistently in order to improve cache hit rate.
+
+Author: Nikolay Lysenko
+"""
+
+
+import bisect
+import hashlib
+import http.client
+import json
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+from flask import Flask, request
+
+from servifier import constants
+from servifier.client import ConnectionPool
+from servifier.utils import report_error
+
+
+def hash_key(key: str) -> int:
+    """Hash a string to an integer that does not depend on process."""
+    digest = hashlib.md5(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+class HashRing:
+    """Consistent hashing of keys to nodes."""
+
+    def __init__(
+            self, nodes: Optional[List[str]] = None, n_replicas: int = 100
+    ):
+        """
+        Initialize an instance.
+
+        :param nodes:
+            (optional) initial nodes
+        :param n_replicas:
+            number of points on the ring per node; the more it is,
+            the more uniformly keys are spread over nodes
+        """
+        self.n_replicas = n_replicas
+        self.points = []
+        self.nodes = []
+        for node in nodes or []:
+            self.add(node)
+
+    def add(self, node: str) -> None:
+        """Add a node (only keys that move to it are remapped)."""
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for replica_id in range(self.n_replicas):
+            point = (hash_key(f'{node}#{replica_id}'), node)
+            bisect.insort(self.points, point)
+
+    def remove(self, node: str) -> None:
+        """Remove a node (only keys that were mapped to it are remapped)."""
+        self.nodes.remove(node)
+        self.points = [point for point in self.points if point[1] != node]
+
+    def get(self, key: str) -> str:
+        """Get node for a key."""
+        if not self.points:
+            raise ValueError("There are no nodes.")
+        index = bisect.bisect(self.points, (hash_key(key),))
+        return self.points[index % len(self.points)][1]
+
+
+def make_routing_key(
+        path: str, data: Any, key_fields: Optional[List[str]]
+) -> str:
+    """
+    Make key such that requests with identical key fields have same keys.
+
+    :param path:
+        API path (from root) to a handle
+    :param data:
+        JSON from request
+    :param key_fields:
+        (optional) names of fields to be used; if it is not passed,
+        all fields except 'login' and 'token' are used
+    :return:
+        routing key
+    """
+    if not isinstance(data, dict):
+        return path
+    if key_fields is None:
+        key_fields = [x for x in data if x not in ['login', 'token']]
+    key_data = {field: data.get(field) for field in key_fields}
+    return path + ' ' + json.dumps(key_data, sort_keys=True)
+
+
+def parse_worker_urls(content: bytes) -> List[str]:
+    """Parse URLs of workers (one per line, '#' for comments)."""
+    lines = content.decode('utf-8').splitlines()
+    lines = [line.split('#')[0].strip() for line in lines]
+    worker_urls = [line for line in lines if line]
+    if not worker_urls:
+        raise ValueError("There are no workers (maybe, file is incomplete).")
+    for worker_url in worker_urls:
+        parsed_url = urlsplit(worker_url)
+        if parsed_url.scheme not in ['http', 'https']:
+            raise ValueError(f"URL {worker_url} is not HTTP(S) URL.")
+        if not parsed_url.hostname:
+            raise ValueError(f"URL {worker_url} has no host.")
+        _ = parsed_url.port  # It raises `ValueError` if port is invalid.
+    return worker_urls
+
+
+class Router:
+    """Dispatcher of requests to workers serving the same API."""
+
+    def __init__(
+            self,
+            worker_urls: Optional[List[str]] = None,
+            key_fields: Optional[Dict[str, List[str]]] = None,
+            n_replicas: int = 100,
+            pool_size: int = 10,
+            timeout: float = 60.0,
+            workers_file: Optional[str] = None
+    ):
+        """
+        Initialize an instance.
+
+        :param worker_urls:
+            (optional) root URLs of workers (e.g., 'http://127.0.0.1:7071');
+            they are fixed unless `add_worker` and `remove_worker` are
+            called in the same process
+        :param key_fields:
+            (optional) mapping from API path to names of fields defining
+            worker for a request; for paths that are not in the mapping,
+            all fields except 'login' and 'token' are used
+        :param n_replicas:
+            number of points on hash ring per worker
+        :param pool_size:
+            maximum number of simultaneously open connections to a worker
+        :param timeout:
+            timeout (in seconds) for blocking operations with sockets
+        :param workers_file:
+            (optional) path to file with root URLs of workers (one per
+            line); it is read before every request and workers are
+            updated after it is changed, so all router processes follow it;
+            the file must be replaced atomically (e.g., by renaming another
+            file), because its partially written versions may be applied
+        """
+        if worker_urls is not None and workers_file is not None:
+            raise ValueError("Workers must be passed either as list or file.")
+        self.key_fields = key_fields or {}
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.ring = HashRing(n_replicas=n_replicas)
+        self.pools = {}
+        self.lock = threading.Lock()
+        self.workers_file = workers_file
+        self.workers_file_content = None
+        self.is_workers_file_broken = False
+        self.reload_lock = threading.Lock()
+        for worker_url in worker_urls or []:
+            self.add_worker(worker_url)
+        if workers_file is not None:
+            self.reload_workers()
+
+    def add_worker(self, worker_url: str) -> None:
+        """Start sending requests to a worker."""
+        with self.lock:
+            if worker_url in self.pools:
+                return
+            self.pools[worker_url] = ConnectionPool(
+                worker_url, self.pool_size, self.timeout
+            )
+            self.ring.add(worker_url)
+
+    def remove_worker(self, worker_url: str) -> None:
+        """Stop sending requests to a worker."""
+        with self.lock:
+            self.ring.remove(worker_url)
+            pool = self.pools.pop(worker_url)
+        # Connections that are busy now are closed once they are returned.
+        pool.close(wait=False)
+
+    def reload_workers(self) -> None:
+        """Update workers if file with their URLs has been changed."""
+        with self.reload_lock:
+            try:
+                with open(self.workers_file, 'rb') as in_file:
+                    content = in_file.read()
+            except OSError:
+                # Current workers are kept; the error is logged only once.
+                if not self.is_workers_file_broken:
+                    logging.exception('Can not read file with workers: ')
+                    self.is_workers_file_broken = True
+                return
+            self.is_workers_file_broken = False
+            if content == self.workers_file_content:
+                return
+            self.workers_file_content = content
+            try:
+                worker_urls = parse_worker_urls(content)
+            except ValueError:
+                # Current workers are kept until the file is changed again.
+                logging.exception('File with workers is malformed: ')
+                return
+            for worker_url in set(self.pools) - set(worker_urls):
+                self.remove_worker(worker_url)
+            for worker_url in worker_urls:
+                self.add_worker(worker_url)
+
+    def choose_worker(
+            self, path: str, data: Any
+    ) -> Tuple[str, ConnectionPool]:
+        """Choose worker for a request."""
+        if self.workers_file is not None:
+            self.reload_workers()
+        key = make_routing_key(path, data, self.key_fields.get(path))
+        with self.lock:
+            worker_url = self.ring.get(key)
+            return worker_url, self.pools[worker_url]
+
+
+def get_request_target() -> Optional[str]:
+    """Get path with query string as sent by user (`None` if malformed)."""
+    target = request.environ.get('RAW_URI', request.environ.get('REQUEST_URI'))
+    if target is None:
+        target = quote(request.script_root + request.path)
+    if request.query_string and '?' not in target:
+        target += '?' + request.query_string.decode('latin-1')
+    if not target.startswith('/') or not target.isascii():
+        return None
+    if re.search('[\x00-\x20\x7f]', target):
+        return None
+    return target
+
+
+def create_router_app(router: Router) -> Flask:
+    """Create Flask app that forwards requests to workers."""
+    app = Flask(__name__)
+
+    @app.route('/', defaults={'path': ''}, methods=['POST'])
+    @app.route('/<path:path>', methods=['POST'])
+    def forward(path: str) -> Tuple[Any, ...]:
+        path = '/' + path
+        target = get_request_target()
+        if target is None:
+            return report_error('check handle address', constants.BAD_REQUEST)
+        body = request.get_data()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None  # Any worker reports about it in a proper way.
+        try:
+            worker_url, pool = router.choose_worker(path, data)
+        except ValueError:
+            return report_error('no workers', constants.SERVICE_UNAVAILABLE)
+        try:
+            status, payload, content_type = pool.post(
+                target, body, request.content_type
+            )
+        except http.client.InvalidURL:
+            return report_error('check handle address', constants.BAD_REQUEST)
+        except (OSError, http.client.HTTPException):
+            logging.exception(f'Worker {worker_url} failed: ')
+            return report_error(
+                'worker is unavailable', constants.SERVICE_UNAVAILABLE
+            )
+        headers = {}
+        if content_type is not None:
+            headers['Content-Type'] = content_type
+        return payload, status, headers
+
+    app.errorhandler(constants.NOT_FOUND)(
+        lambda _: report_error('check handle address', constants.NOT_FOUND)
+    )
+    return app
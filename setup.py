@@ -30,6 +30,6 @@ setup(
     license='MIT',
     keywords='web_service api_maker apify ml_engineering model_to_production',
     packages=find_packages(exclude=['tests', 'docs']),
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     install_requires=['Flask']
 )
@@ -5,13 +5,16 @@ Author: Nikolay Lysenko
 """
 
 
-from typing import Dict, Any
+import threading
+from typing import Dict, List, Any
 
 import pytest
+from flask import Flask, request
 from flask.testing import FlaskClient
 
 from servifier import HandleSpec, create_app, validation
 from servifier.auth import generate_token
+from tests.utils import run_server
 
 
 def evaluate_apartment(area: float, distance_to_underground: int) -> float:
@@ -74,3 +77,119 @@ def simple_broken_app_client() -> FlaskClient:
     app = create_app([handle_spec])
     client = app.test_client()
     yield client
+
+
+@pytest.fixture()
+def apartment_prices_app_url() -> str:
+    """Run demo Flask app that evaluates apartments and return its URL."""
+    handle_spec = HandleSpec(
+        evaluate_apartment,
+        '/evaluate',
+        ApartmentParameters,
+        '1234'
+    )
+    app = create_app([handle_spec])
+    yield from run_server(app)
+
+
+def create_counting_app() -> Flask:
+    """Create demo Flask app that counts calls of its function."""
+    calls = []
+
+    def add_numbers(first: int, second: int) -> int:
+        """Add two numbers."""
+        calls.append((first, second))
+        return first + second
+
+    app = create_app([HandleSpec(add_numbers, '/add')])
+    app.config['CALLS'] = calls
+    return app
+
+
+@pytest.fixture()
+def counting_app() -> Flask:
+    """Create demo Flask app that counts calls of its function."""
+    return create_counting_app()
+
+
+@pytest.fixture()
+def counting_app_url(counting_app: Flask) -> str:
+    """Run demo Flask app that counts calls and return its URL."""
+    yield from run_server(counting_app)
+
+
+@pytest.fixture()
+def counting_workers() -> List[Flask]:
+    """Create several instances of demo Flask app that counts calls."""
+    return [create_counting_app() for _ in range(3)]
+
+
+@pytest.fixture()
+def counting_workers_urls(counting_workers: List[Flask]) -> List[str]:
+    """Run several instances of demo Flask app and return their URLs."""
+    servers = [run_server(app) for app in counting_workers]
+    yield [next(server) for server in servers]
+    for server in servers:
+        next(server, None)
+
+
+@pytest.fixture()
+def gated_app() -> Flask:
+    """Create demo Flask app that waits for a signal before responding."""
+    calls = []
+    started = threading.Event()
+    released = threading.Event()
+
+    def divide_numbers(first: int, second: int) -> float:
+        """Divide two numbers once signal is received."""
+        calls.append((first, second))
+        started.set()
+        if not released.wait(timeout=5):
+            raise TimeoutError("Signal was not received.")
+        return first / second
+
+    app = create_app([HandleSpec(divide_numbers, '/divide')])
+    app.config.update(CALLS=calls, STARTED=started, RELEASED=released)
+    return app
+
+
+@pytest.fixture()
+def gated_app_url(gated_app: Flask) -> str:
+    """Run demo Flask app that waits for a signal and return its URL."""
+    yield from run_server(gated_app)
+
+
+@pytest.fixture()
+def echo_app_url() -> str:
+    """Run demo Flask app that returns details of requests to it."""
+    app = Flask(__name__)
+
+    @app.route('/', defaults={'path': ''}, methods=['POST'])
+    @app.route('/<path:path>', methods=['POST'])
+    def echo(path: str) -> Any:
+        if request.args.get('format') == 'html':
+            return f'<p>{path}</p>', 200
+        result = {
+            'path': request.environ.get('RAW_URI'),
+            'content_type': request.content_type,
+            'query_string': request.query_string.decode(),
+        }
+        return {'result': result, 'status': 200}, 200
+
+    yield from run_server(app)
+
+
+@pytest.fixture()
+def overloaded_app_url() -> str:
+    """Run demo Flask app that is unavailable for the first two requests."""
+    app = Flask(__name__)
+    calls = []
+
+    @app.route('/add', methods=['POST'])
+    def add() -> Any:
+        calls.append(None)
+        if len(calls) <= 2:
+            return {'error': 'Service Unavailable', 'status': 503}, 503
+        return {'result': 4, 'status': 200}, 200
+
+    yield from run_server(app)
@@ -0,0 +1,266 @@
+"""
+Test `servifier.client` module.
+
+Author: Nikolay Lysenko
+"""
+
+
+import asyncio
+import pickle
+import threading
+import time
+from typing import Any, List
+
+import pytest
+from flask import Flask
+
+from servifier.client import (
+    AsyncClient, Client, ConnectionPool, ServiceError, parse_response
+)
+from tests.utils import make_connections_stale
+
+
+class PendingCallsMock(dict):
+    """Mock for pending calls that counts lookups of existing calls."""
+
+    def __init__(self):
+        super().__init__()
+        self.n_hits = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = super().get(key, default)
+        if value is not None:
+            self.n_hits += 1
+        return value
+
+
+class ConnectionMock:
+    """Mock for HTTP connection that remembers whether it is closed."""
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_call_with_valid_inputs(apartment_prices_app_url: str) -> None:
+    """Test that client sends credentials and returns result."""
+    with Client(
+            apartment_prices_app_url, 'user', {'/evaluate': '1234'}
+    ) as client:
+        result = client.call(
+            '/evaluate', area=30.0, distance_to_underground=300
+        )
+    assert result == 5700000
+
+
+def test_call_with_wrong_salt(apartment_prices_app_url: str) -> None:
+    """Test that client raises an error if API forbids request."""
+    with Client(
+            apartment_prices_app_url, 'user', {'/evaluate': '123'}
+    ) as client:
+        with pytest.raises(ServiceError) as exc_info:
+            client.call('/evaluate', area=30.0, distance_to_underground=300)
+    assert exc_info.value.status == 403
+    assert 'Forbidden' in str(exc_info.value)
+
+
+def test_call_with_invalid_inputs(apartment_prices_app_url: str) -> None:
+    """Test that client raises an error if API rejects arguments."""
+    with Client(
+            apartment_prices_app_url, 'user', {'/evaluate': '1234'}
+    ) as client:
+        with pytest.raises(ServiceError) as exc_info:
+            client.call('/evaluate', area=30, distance_to_underground=300)
+    assert exc_info.value.status == 422
+
+
+def test_call_many(apartment_prices_app_url: str) -> None:
+    """Test that concurrent calls return results in order of inputs."""
+    inputs = [
+        {'area': 30.0, 'distance_to_underground': 300},
+        {'area': 65.5, 'distance_to_underground': 1000},
+        {'area': 99.0, 'distance_to_underground': 100},
+    ]
+    with Client(
+            apartment_prices_app_url, 'user', {'/evaluate': '1234'},
+            pool_size=2
+    ) as client:
+        results = client.call_many('/evaluate', inputs * 3)
+    assert results == [5700000, 12100000, 19700000] * 3
+
+
+def test_async_call_many(counting_app_url: str) -> None:
+    """Test that asyncio interface returns results in order of inputs."""
+
+    async def run() -> list:
+        async with AsyncClient(counting_app_url) as client:
+            single_result = await client.call('/add', first=1, second=3)
+            results = await client.call_many(
+                '/add', [{'first': x, 'second': 1} for x in range(5)]
+            )
+        return [single_result] + results
+
+    assert asyncio.run(run()) == [4, 1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize(
+    "max_retries, expected_status",
+    [
+        (2, None),
+        (1, 503),
+    ]
+)
+def test_retries_on_service_unavailable(
+        overloaded_app_url: str, max_retries: int, expected_status: int
+) -> None:
+    """Test that client repeats requests only limited number of times."""
+    with Client(
+            overloaded_app_url, max_retries=max_retries, backoff=0.0
+    ) as client:
+        if expected_status is None:
+            assert client.call('/add', first=1, second=3) == 4
+        else:
+            with pytest.raises(ServiceError) as exc_info:
+                client.call('/add', first=1, second=3)
+            assert exc_info.value.status == expected_status
+
+
+@pytest.mark.parametrize(
+    "coalesce, expected_n_calls",
+    [
+        (True, 2),
+        (False, 6),
+    ]
+)
+def test_coalescing(
+        counting_app: Flask, counting_app_url: str,
+        coalesce: bool, expected_n_calls: int
+) -> None:
+    """Test that identical calls are sent once if coalescing is enabled."""
+    inputs = [{'first': 1, 'second': 3}, {'second': 1, 'first': 2}] * 3
+    with Client(counting_app_url, coalesce=coalesce) as client:
+        results = client.call_many('/add', inputs)
+    assert results == [4, 3] * 3
+    assert len(counting_app.config['CALLS']) == expected_n_calls
+
+
+def test_connection_pool_close() -> None:
+    """Test that closing pool closes every pooled connection."""
+    pool = ConnectionPool('http://127.0.0.1:5000', size=3, timeout=1.0)
+    for _ in range(3):
+        pool.acquire()
+    mocks = [ConnectionMock() for _ in range(3)]
+    for mock in mocks:
+        pool.release(mock, reusable=True)
+    pool.close()
+    assert [mock.closed for mock in mocks] == [True, True, True]
+
+
+def test_connection_pool_close_without_waiting() -> None:
+    """Test that busy connections are closed once they are returned."""
+    pool = ConnectionPool('http://127.0.0.1:5000', size=2, timeout=1.0)
+    for _ in range(2):
+        pool.acquire()
+    idle_mock, busy_mock, late_mock = [ConnectionMock() for _ in range(3)]
+    pool.release(idle_mock, reusable=True)
+    pool.close(wait=False)
+    assert idle_mock.closed
+    pool.release(busy_mock, reusable=True)
+    assert busy_mock.closed
+    pool.acquire()
+    pool.release(late_mock, reusable=True)
+    assert late_mock.closed
+
+
+def test_call_over_stale_connection(counting_app_url: str) -> None:
+    """Test that stale keep-alive connection does not consume retries."""
+    with Client(counting_app_url, pool_size=1, max_retries=0) as client:
+        make_connections_stale(client.pool)
+        assert client.call('/add', first=1, second=3) == 4
+
+
+@pytest.mark.parametrize(
+    "second, expected",
+    [
+        (4, 0.25),
+        (0, ServiceError),
+    ]
+)
+def test_coalescing_of_concurrent_calls(
+        gated_app: Flask, gated_app_url: str, second: int, expected: Any
+) -> None:
+    """Test that concurrent identical calls share a single request."""
+    outcomes: List[Any] = [None] * 5
+
+    def call(index: int) -> None:
+        try:
+            outcomes[index] = client.call('/divide', first=1, second=second)
+        except ServiceError as e:
+            outcomes[index] = e
+
+    with Client(gated_app_url, coalesce=True, max_retries=0) as client:
+        client.pending_calls = PendingCallsMock()
+        leader = threading.Thread(target=call, args=(0,))
+        leader.start()
+        assert gated_app.config['STARTED'].wait(timeout=5)
+        followers = [
+            threading.Thread(target=call, args=(index,))
+            for index in range(1, 5)
+        ]
+        for follower in followers:
+            follower.start()
+        # Once a follower finds the pending call, it waits for the leader.
+        deadline = time.monotonic() + 5
+        while client.pending_calls.n_hits < 4:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        gated_app.config['RELEASED'].set()
+        for thread in [leader] + followers:
+            thread.join()
+        assert not client.pending_calls
+    assert len(gated_app.config['CALLS']) == 1
+    if expected is ServiceError:
+        assert all(outcome is outcomes[0] for outcome in outcomes)
+        assert outcomes[0].status == 500
+    else:
+        assert outcomes == [expected] * 5
+
+
+def test_async_close_does_not_block_event_loop(
+        gated_app: Flask, gated_app_url: str
+) -> None:
+    """Test that closing async client lets event loop run other tasks."""
+
+    async def run() -> None:
+        loop = asyncio.get_running_loop()
+        client = AsyncClient(gated_app_url)
+        call = asyncio.ensure_future(client.call('/divide', first=1, second=2))
+        started = gated_app.config['STARTED']
+        assert await loop.run_in_executor(None, started.wait, 5)
+        # If closing blocks event loop, signal is not sent and call fails.
+        loop.call_soon(gated_app.config['RELEASED'].set)
+        await client.aclose()
+        assert await call == 0.5
+
+    asyncio.run(run())
+
+
+def test_service_error_pickling() -> None:
+    """Test that error can be passed to another process."""
+    error = pickle.loads(pickle.dumps(ServiceError('Forbidden: x', 403)))
+    assert str(error) == 'Forbidden: x'
+    assert error.status == 403
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [b'<html></html>', b'[1, 2]', b'{"status": 200}']
+)
+def test_parse_response_with_malformed_payload(payload: bytes) -> None:
+    """Test that unexpected successful responses are reported."""
+    with pytest.raises(ServiceError) as exc_info:
+        parse_response(200, payload)
+    assert 'Malformed response' in str(exc_info.value)
+    assert exc_info.value.status == 200
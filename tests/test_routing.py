@@ -0,0 +1,336 @@
+"""
+Test `servifier.routing` module.
+
+Author: Nikolay Lysenko
+"""
+
+
+import json
+import logging
+import os
+import pathlib
+from typing import List
+
+import pytest
+from flask import Flask
+
+from servifier.routing import HashRing, Router, create_router_app
+from tests.utils import make_connections_stale
+
+
+def test_hash_ring_is_consistent() -> None:
+    """Test that a key is mapped to the same node by different rings."""
+    nodes = ['a', 'b', 'c']
+    first_ring = HashRing(nodes)
+    second_ring = HashRing(nodes[::-1])
+    keys = [str(x) for x in range(1000)]
+    first_nodes = [first_ring.get(x) for x in keys]
+    assert first_nodes == [second_ring.get(x) for x in keys]
+    assert set(first_nodes) == set(nodes)
+
+
+def test_hash_ring_remaps_few_keys_after_adding() -> None:
+    """Test that adding a node remaps only keys that move to this node."""
+    ring = HashRing(['a', 'b', 'c', 'd'])
+    keys = [str(x) for x in range(1000)]
+    nodes_before = [ring.get(x) for x in keys]
+    ring.add('e')
+    nodes_after = [ring.get(x) for x in keys]
+    remapped = [
+        after for before, after in zip(nodes_before, nodes_after)
+        if before != after
+    ]
+    assert set(remapped) == {'e'}
+    assert len(remapped) < 350
+
+
+def test_hash_ring_remaps_few_keys_after_removal() -> None:
+    """Test that removing a node remaps only keys that were mapped to it."""
+    ring = HashRing(['a', 'b', 'c', 'd'])
+    keys = [str(x) for x in range(1000)]
+    nodes_before = [ring.get(x) for x in keys]
+    ring.remove('b')
+    nodes_after = [ring.get(x) for x in keys]
+    for before, after in zip(nodes_before, nodes_after):
+        if before != 'b':
+            assert before == after
+        else:
+            assert after != 'b'
+
+
+def test_hash_ring_without_nodes() -> None:
+    """Test that empty ring can not map keys."""
+    with pytest.raises(ValueError):
+        HashRing().get('key')
+
+
+@pytest.mark.parametrize(
+    "key_fields, expected_n_busy_workers",
+    [
+        ({'/add': ['first']}, 1),
+        (None, 3),
+    ]
+)
+def test_router_app(
+        counting_workers: List[Flask], counting_workers_urls: List[str],
+        key_fields: dict, expected_n_busy_workers: int
+) -> None:
+    """Test that requests with identical key fields go to the same worker."""
+    router = Router(counting_workers_urls, key_fields)
+    client = create_router_app(router).test_client()
+    for second in range(30):
+        response = client.post(
+            '/add',
+            data=json.dumps({'first': 1, 'second': second}),
+            content_type='application/json'
+        )
+        assert response.status_code == 200
+        assert response.json['result'] == 1 + second
+    n_calls = [len(app.config['CALLS']) for app in counting_workers]
+    assert sum(n_calls) == 30
+    assert sum(x > 0 for x in n_calls) == expected_n_busy_workers
+
+
+def test_router_app_forwards_errors(counting_workers_urls: List[str]) -> None:
+    """Test that router passes errors from workers to users."""
+    client = create_router_app(Router(counting_workers_urls)).test_client()
+    response = client.post(
+        '/add',
+        data=json.dumps({'first': 1, 'second': 3})[:-1],
+        content_type='application/json'
+    )
+    assert response.status_code == 400
+    assert 'Bad Request' in response.json['error']
+
+
+@pytest.mark.parametrize(
+    "content_type, query_string",
+    [
+        ('application/json', ''),
+        ('text/plain', 'a=1&b=2'),
+        (None, 'a=1'),
+    ]
+)
+def test_router_app_forwards_headers(
+        echo_app_url: str, content_type: str, query_string: str
+) -> None:
+    """Test that router passes content type and query string to workers."""
+    client = create_router_app(Router([echo_app_url])).test_client()
+    response = client.post(
+        '/echo',
+        data=json.dumps({'first': 1, 'second': 3}),
+        content_type=content_type,
+        query_string=query_string
+    )
+    assert response.status_code == 200
+    assert response.json['result']['content_type'] == content_type
+    assert response.json['result']['query_string'] == query_string
+
+
+@pytest.mark.parametrize(
+    "path, environ_overrides, expected_status, expected_path",
+    [
+        ('/', None, 200, '/'),
+        ('/a%20b', None, 200, '/a%20b'),
+        ('/caf%C3%A9?x=%C3%A9', None, 200, '/caf%C3%A9?x=%C3%A9'),
+        ('/a', {'RAW_URI': '/a b'}, 400, None),
+        ('/a', {'RAW_URI': '/caf\xc3\xa9'}, 400, None),
+    ]
+)
+def test_router_app_forwards_paths(
+        echo_app_url: str, path: str, environ_overrides: dict,
+        expected_status: int, expected_path: str
+) -> None:
+    """Test that router passes paths to workers exactly as they are sent."""
+    client = create_router_app(Router([echo_app_url])).test_client()
+    response = client.post(
+        path,
+        data=json.dumps({'first': 1, 'second': 3}),
+        content_type='application/json',
+        environ_overrides=environ_overrides
+    )
+    assert response.status_code == expected_status
+    if expected_path is None:
+        assert 'Bad Request' in response.json['error']
+    else:
+        assert response.json['result']['path'] == expected_path
+
+
+@pytest.mark.parametrize(
+    "query_string, expected_content_type",
+    [
+        ('', 'application/json'),
+        ('format=html', 'text/html; charset=utf-8'),
+    ]
+)
+def test_router_app_forwards_content_type_of_response(
+        echo_app_url: str, query_string: str, expected_content_type: str
+) -> None:
+    """Test that router passes content type of responses from workers."""
+    client = create_router_app(Router([echo_app_url])).test_client()
+    response = client.post(
+        '/echo',
+        data=json.dumps({'first': 1, 'second': 3}),
+        content_type='application/json',
+        query_string=query_string
+    )
+    assert response.status_code == 200
+    assert response.content_type == expected_content_type
+
+
+def test_router_app_with_absent_handle(
+        counting_workers_urls: List[str]
+) -> None:
+    """Test that router passes responses about absent handles."""
+    client = create_router_app(Router(counting_workers_urls)).test_client()
+    response = client.post(
+        '/non%20existing_handle',
+        data=json.dumps({'first': 1, 'second': 3}),
+        content_type='application/json'
+    )
+    assert response.status_code == 404
+    assert 'Not Found' in response.json['error']
+
+
+def test_router_app_rejects_non_json(
+        counting_workers_urls: List[str]
+) -> None:
+    """Test that router does not make non-JSON requests valid."""
+    client = create_router_app(Router(counting_workers_urls)).test_client()
+    response = client.post(
+        '/add',
+        data=json.dumps({'first': 1, 'second': 3}),
+        content_type='text/plain'
+    )
+    assert response.status_code == 400
+
+
+def test_router_app_with_unavailable_workers() -> None:
+    """Test that router reports about workers that can not be reached."""
+    router = Router(['http://127.0.0.1:1'])
+    client = create_router_app(router).test_client()
+    response = client.post(
+        '/add',
+        data=json.dumps({'first': 1, 'second': 3}),
+        content_type='application/json'
+    )
+    assert response.status_code == 503
+    router.remove_worker('http://127.0.0.1:1')
+    response = client.post(
+        '/add',
+        data=json.dumps({'first': 1, 'second': 3}),
+        content_type='application/json'
+    )
+    assert response.status_code == 503
+    assert 'no workers' in response.json['error']
+
+
+def test_router_app_with_stale_connections(
+        counting_workers_urls: List[str]
+) -> None:
+    """Test that router resends requests over stale connections."""
+    worker_url = counting_workers_urls[0]
+    router = Router([worker_url], pool_size=1)
+    make_connections_stale(router.pools[worker_url])
+    client = create_router_app(router).test_client()
+    response = client.post(
+        '/add',
+        data=json.dumps({'first': 1, 'second': 3}),
+        content_type='application/json'
+    )
+    assert response.status_code == 200
+    assert response.json['result'] == 4
+
+
+def test_router_app_with_workers_file(
+        counting_workers: List[Flask], counting_workers_urls: List[str],
+        tmp_path: pathlib.Path
+) -> None:
+    """Test that router follows changes of file with workers."""
+    workers_file = tmp_path / 'workers.txt'
+    workers_file.write_text(
+        '# Workers:\n' + '\n'.join(counting_workers_urls) + '\n\n'
+    )
+    router = Router(workers_file=str(workers_file))
+    client = create_router_app(router).test_client()
+
+    def send_requests() -> List[int]:
+        for first in range(30):
+            response = client.post(
+                '/add',
+                data=json.dumps({'first': first, 'second': 1}),
+                content_type='application/json'
+            )
+            assert response.status_code == 200
+        n_calls = [len(app.config['CALLS']) for app in counting_workers]
+        for app in counting_workers:
+            app.config['CALLS'].clear()
+        return n_calls
+
+    assert all(x > 0 for x in send_requests())
+    workers_file.write_text(counting_workers_urls[1] + '  # The only one.')
+    assert send_requests() == [0, 30, 0]
+    assert set(router.pools) == {counting_workers_urls[1]}
+
+
+def test_router_with_both_list_and_file_of_workers() -> None:
+    """Test that workers can not be passed in two ways at once."""
+    with pytest.raises(ValueError):
+        Router(['http://127.0.0.1:7071'], workers_file='workers.txt')
+
+
+def test_router_app_with_missing_workers_file(
+        counting_workers_urls: List[str], tmp_path: pathlib.Path,
+        caplog: pytest.LogCaptureFixture
+) -> None:
+    """Test that missing file with workers is reported only once."""
+    workers_file = tmp_path / 'workers.txt'
+    workers_file.write_text(counting_workers_urls[0])
+    router = Router(workers_file=str(workers_file))
+    client = create_router_app(router).test_client()
+    workers_file.unlink()
+    with caplog.at_level(logging.ERROR):
+        for _ in range(3):
+            response = client.post(
+                '/add',
+                data=json.dumps({'first': 1, 'second': 3}),
+                content_type='application/json'
+            )
+            assert response.status_code == 200
+    assert len(caplog.records) == 1
+
+
+def test_router_with_same_size_edit_of_workers_file(
+        tmp_path: pathlib.Path
+) -> None:
+    """Test that file with workers is checked by content, not by metadata."""
+    workers_file = tmp_path / 'workers.txt'
+    workers_file.write_text('http://127.0.0.1:7071\n')
+    stat = os.stat(workers_file)
+    router = Router(workers_file=str(workers_file))
+    assert set(router.pools) == {'http://127.0.0.1:7071'}
+    workers_file.write_text('http://127.0.0.1:7072\n')
+    os.utime(workers_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    router.reload_workers()
+    assert set(router.pools) == {'http://127.0.0.1:7072'}
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        '',
+        '# Nothing here yet.\n',
+        'http://127.0.0.1:7071\nhttp://127.0.0.1:70x',
+        '127.0.0.1:7072',
+    ]
+)
+def test_router_with_malformed_workers_file(
+        tmp_path: pathlib.Path, content: str
+) -> None:
+    """Test that malformed file with workers is ignored."""
+    workers_file = tmp_path / 'workers.txt'
+    workers_file.write_text('http://127.0.0.1:7071\n')
+    router = Router(workers_file=str(workers_file))
+    workers_file.write_text(content)
+    router.reload_workers()
+    assert set(router.pools) == {'http://127.0.0.1:7071'}
@@ -0,0 +1,41 @@
+"""
+Provide helpers for tests.
+
+Author: Nikolay Lysenko
+"""
+
+
+import socket
+import threading
+from typing import Iterator
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from servifier.client import ConnectionPool
+
+
+def run_server(app: Flask) -> Iterator[str]:
+    """Run Flask app in a background thread and yield its URL."""
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={'poll_interval': 0.05},
+        daemon=True
+    )
+    thread.start()
+    url = f'http://127.0.0.1:{server.server_port}'
+    yield url
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def make_connections_stale(pool: ConnectionPool) -> None:
+    """Replace sockets of idle connections with sockets closed by peer."""
+    connections = [pool.acquire() for _ in range(pool.size)]
+    for connection in connections:
+        connection.close()
+        connection.sock, peer_sock = socket.socketpair()
+        peer_sock.close()
+    for connection in connections[::-1]:
+        pool.release(connection, reusable=True)